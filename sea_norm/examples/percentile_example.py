@@ -19,13 +19,14 @@ where there is data.
 
 """
 
+from functools import partial
+
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from sea_norm import sean
 
-# define a function that will return a lambda
-# percentile function
+# define a function that will return a percentile function
 def makepercentile(x):
     """
     Parameters
@@ -36,16 +37,17 @@ def makepercentile(x):
     Returns
     -------
     TYPE
-        Lambda function to calculate x'th percentile.
+        Function to calculate x'th percentile. Built with
+        functools.partial so sean() can compute it from
+        the sorted bins instead of calling it per bin.
 
     """
-    return lambda stat: np.nanpercentile(stat, x)
+    return partial(np.nanpercentile, q=x)
 
 # get the percentiles 
 # use the makepercentile() function
-# to return a lambda function for
-# different percentiles, required for
-# how the lambdas are bound 
+# to return a function for
+# different percentiles
 seastats = {}
 for x in np.arange(10,100,10):
     seastats[f'{x}th_%tile'] = makepercentile(x)
@@ -59,8 +61,6 @@ sea_cols = ['V']
 # specify the number of bins in phase 1 and phase 2 as [nbins1, nbins2]
 bins=[20, 120]
 
-# define a set of lambda functions that will be used
-
 # load omni data and select 
 # columns to run analysis on
 omnidata = pd.read_csv(o_dat,parse_dates=True, 
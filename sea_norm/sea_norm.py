@@ -30,11 +30,556 @@ with a dictionary of metadata that can be used for plotting and reference.
 
 """
 
-from tqdm import tqdm
+import logging
 import numpy as np
 import pandas as pd
-from scipy import stats
-import gc
+import warnings
+from functools import lru_cache, partial
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+logger = logging.getLogger(__name__)
+
+# statistics that only need the sum and count of the samples in
+# each bin, these are calculated with np.bincount and values
+# name the reduction used
+_BINCOUNT_STATS = {
+    "count": "count",
+    "sum": "sum",
+    np.sum: "sum",
+    np.nansum: "nansum",
+    "mean": "mean",
+    np.mean: "mean",
+    np.nanmean: "nanmean",
+}
+
+# statistics taken from the values of each bin sorted in a
+# single pass, values name the reduction used
+_SORTED_STATS = {
+    "median": "median",
+    np.median: "median",
+    np.nanmedian: "nanmedian",
+    "min": "min",
+    np.min: "min",
+    "max": "max",
+    np.max: "max",
+}
+
+# percentile and quantile functions that are also taken from the
+# sorted values when given as functools.partial(func, q=q), values
+# scale q to a quantile between 0 and 1
+_SORTED_QUANTILES = {
+    np.nanpercentile: 100,
+    np.nanquantile: 1,
+}
+
+# remaining statistics named as in scipy.stats.binned_statistic( )
+# and the callable used to calculate them for each bin
+_NAMED_STATS = {
+    "std": np.std,
+}
+
+
+@lru_cache(maxsize=32)
+def _time_axis(x1, x2):
+    """
+    Normalized time bin edges for both phases and the normalized time axis.
+
+    The same x_dimensions are typically reused across calls so the arrays
+    are cached, they are shared between calls and so made read only.
+
+    Parameters
+    ----------
+    x1, x2 : int
+        Elements of x_dimensions for phase 1 and phase 2.
+
+    Returns
+    -------
+    x1_edges, x2_edges : np.ndarray
+        Bin edges in normalized time for phase 1 and phase 2.
+    t_norm : np.ndarray
+        Normalized time of the bins of both phases.
+
+    """
+    # determine the spacing in normalized time for both phases
+    # each phase is normalized to 1 and then binned based on the
+    # spacing and bin sizes defined by x_dimensions
+    x1_spacing, x2_spacing = 1 / x1, 1 / x2
+
+    # create bins and edges in normalized
+    # time for binning the data in both phases
+    x1_edges = np.linspace(0, 1, np.int64(x1))
+    x2_edges = np.linspace(0, 1, np.int64(x2))
+
+    x1bins = x1_edges[0:-1]
+    x2bins = x2_edges[0:-1]
+
+    # create normalized time axis
+    t_norm = (x1bins - x1bins.max() - x1_spacing) / x1_spacing
+    t_norm = np.concatenate([t_norm, x2bins / x2_spacing])
+
+    for a in (x1_edges, x2_edges, t_norm):
+        a.flags.writeable = False
+
+    return x1_edges, x2_edges, t_norm
+
+
+def _uniform_bin(x, edges):
+    """
+    Bin number of each value for uniformly spaced edges, -1 if not binned.
+
+    Values on an edge fall in the bin to the right of it apart from the last
+    edge, which is included in the last bin using the same rounding tolerance
+    as scipy.stats.binned_statistic( ).
+    """
+    n = len(edges) - 1
+
+    # the bin is found arithmetically from the edge spacing and
+    # then nudged by one where rounding leaves the value on the
+    # wrong side of an edge, so it matches np.digitize exactly
+    with np.errstate(invalid="ignore"):
+        idx = (x - edges[0]) * (n / (edges[-1] - edges[0]))
+    idx = np.clip(np.nan_to_num(idx), 0, n - 1).astype(np.intp)
+    idx -= x < edges[idx]
+    idx += (x >= edges[idx + 1]) & (idx < n - 1)
+
+    decimal = int(-np.log10(np.diff(edges).min())) + 6
+    on_edge = (x >= edges[-1]) & (
+        np.around(x, decimal) == np.around(edges[-1], decimal)
+    )
+    idx[on_edge] = n - 1
+    idx[~(((x >= edges[0]) & (x < edges[-1])) | on_edge)] = -1
+
+    return idx
+
+
+def _bin_numbers(t_norm, x_edges, y=None, y_edges=None):
+    """
+    Flattened bin number of each sample, -1 if it is not binned.
+
+    Bins are numbered as the flattened (x, y) statistic array for a 2D
+    analysis, or along x only for a 1D analysis.
+    """
+    x_idx = _uniform_bin(t_norm, x_edges)
+    if y is None:
+        return x_idx
+
+    y_idx = _uniform_bin(y, y_edges)
+    binned = (x_idx >= 0) & (y_idx >= 0)
+
+    return np.where(binned, x_idx * (len(y_edges) - 1) + y_idx, -1)
+
+
+def _bin_sums(bin_idx, values, nbins):
+    """
+    Sample count per bin and NaN ignoring sum and count per bin of values.
+
+    Parameters
+    ----------
+    bin_idx : np.ndarray
+        Flattened bin number of each sample, -1 if it is not binned.
+    values : np.ndarray
+        Data to be summed with shape (number of columns, number of samples).
+    nbins : int
+        Total number of bins.
+
+    Returns
+    -------
+    count : np.ndarray
+        Number of samples in each bin, shape (nbins,).
+    nan_sum, nan_count : np.ndarray
+        Sum and count of the non NaN values in each bin for each
+        column, shape (values.shape[0], nbins).
+
+    """
+    binned = bin_idx >= 0
+    bin_idx = bin_idx[binned]
+    values = values[:, binned]
+    count = np.bincount(bin_idx, minlength=nbins).astype(np.float64)
+
+    nan_sum = np.empty((values.shape[0], nbins))
+    nan_count = np.empty((values.shape[0], nbins))
+    for i, v in enumerate(values):
+        finite = ~np.isnan(v)
+        nan_sum[i] = np.bincount(
+            bin_idx, weights=np.where(finite, v, 0), minlength=nbins
+        )
+        nan_count[i] = np.bincount(bin_idx, weights=finite, minlength=nbins)
+
+    return count, nan_sum, nan_count
+
+
+def _event_sums(idx_i8, col_mat, lo, hi, x_edges, y_idx, ny):
+    """
+    Same as _bin_sums but accumulated directly from the events with numba.
+
+    Parameters
+    ----------
+    idx_i8 : np.ndarray
+        Time index of the data as int64 nanoseconds.
+    col_mat : np.ndarray
+        Data for every row with shape (number of columns, number of rows).
+    lo, hi : np.ndarray
+        Row positions bounding the phase of each event.
+    x_edges : np.ndarray
+        Edges of the normalized time bins.
+    y_idx : np.ndarray
+        y bin number of every row, -1 if it is not binned, all zero
+        for a 1D analysis.
+    ny : int
+        Number of y bins, 1 for a 1D analysis.
+
+    Returns
+    -------
+    See _bin_sums.
+
+    """
+    # split the events into one contiguous chunk per thread so
+    # each thread accumulates into its own bins without contention
+    n_chunks = max(min(numba.get_num_threads(), len(lo)), 1)
+    chunks = np.linspace(0, len(lo), n_chunks + 1).astype(np.intp)
+
+    count, nan_sum, nan_count = _event_sums_kernel(
+        idx_i8, col_mat, lo, hi, x_edges, y_idx, ny, chunks
+    )
+
+    return count.sum(axis=0), nan_sum.sum(axis=0), nan_count.sum(axis=0)
+
+
+if numba is not None:
+    # fastmath is limited to flags that keep NaN checks and
+    # the division used to normalize time exact
+    @numba.njit(parallel=True, fastmath={"nsz", "reassoc", "contract"}, cache=True)
+    def _event_sums_kernel(idx_i8, col_mat, lo, hi, x_edges, y_idx, ny, chunks):
+        n_chunks = len(chunks) - 1
+        ncols = col_mat.shape[0]
+        nx = len(x_edges) - 1
+        count = np.zeros((n_chunks, nx * ny))
+        nan_sum = np.zeros((n_chunks, ncols, nx * ny))
+        nan_count = np.zeros((n_chunks, ncols, nx * ny))
+
+        for k in numba.prange(n_chunks):
+            for e in range(chunks[k], chunks[k + 1]):
+                # a phase with a single sample has no
+                # duration and none of its data is binned
+                t0 = idx_i8[lo[e]]
+                dt = idx_i8[hi[e] - 1] - t0
+                if dt == 0:
+                    continue
+
+                for i in range(lo[e], hi[e]):
+                    if y_idx[i] < 0:
+                        continue
+
+                    # normalize time and find the bin exactly
+                    # as _phase_rows and _uniform_bin do
+                    x = (idx_i8[i] - t0) / dt
+                    b = min(int(x * nx), nx - 1)
+                    if x < x_edges[b]:
+                        b -= 1
+                    elif b < nx - 1 and x >= x_edges[b + 1]:
+                        b += 1
+                    b = b * ny + y_idx[i]
+
+                    count[k, b] += 1
+                    for c in range(ncols):
+                        v = col_mat[c, i]
+                        if not np.isnan(v):
+                            nan_sum[k, c, b] += v
+                            nan_count[k, c, b] += 1
+
+        return count, nan_sum, nan_count
+
+
+def _sum_stat(reduction, count, nan_sum, nan_count):
+    """Calculate one of the _BINCOUNT_STATS from the output of _bin_sums."""
+    if reduction == "count":
+        return np.broadcast_to(count, nan_sum.shape)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if reduction == "nansum":
+            return nan_sum
+        if reduction == "nanmean":
+            return np.where(nan_count > 0, nan_sum / nan_count, np.nan)
+
+        # plain sum and mean are NaN if any of the values are
+        has_nan = nan_count < count
+        if reduction == "sum":
+            return np.where(has_nan, np.nan, nan_sum)
+        return np.where(has_nan | (count == 0), np.nan, nan_sum / count)
+
+
+def _bin_sorted(bin_idx, values, nbins):
+    """
+    Sort the values of every column by bin and then by value.
+
+    Parameters
+    ----------
+    bin_idx : np.ndarray
+        Flattened bin number of each sample, -1 if it is not binned.
+    values : np.ndarray
+        Data with shape (number of columns, number of samples).
+    nbins : int
+        Total number of bins.
+
+    Returns
+    -------
+    count : np.ndarray
+        Number of samples in each bin, shape (nbins,).
+    offsets : np.ndarray
+        Position of the first sample of each bin in the sorted values.
+    sorted_vals : list
+        Values of each column sorted by bin and then value, NaN values
+        are placed at the end of their bin.
+    nan_count : np.ndarray
+        Count of the non NaN values in each bin for each column,
+        shape (values.shape[0], nbins).
+
+    """
+    binned = bin_idx >= 0
+    bin_idx = bin_idx[binned]
+    values = values[:, binned]
+    count = np.bincount(bin_idx, minlength=nbins)
+    offsets = np.cumsum(count) - count
+
+    sorted_vals = []
+    nan_count = np.empty((values.shape[0], nbins), dtype=np.intp)
+    for i, v in enumerate(values):
+        # sort by value and then stable sort that order by bin,
+        # two argsorts are much faster than np.lexsort( ) here
+        o = np.argsort(v)
+        o = o[np.argsort(bin_idx[o], kind="stable")]
+        sorted_vals.append(v[o])
+        nan_count[i] = np.bincount(bin_idx[~np.isnan(v)], minlength=nbins)
+
+    return count, offsets, sorted_vals, nan_count
+
+
+def _sorted_reduction(statistic):
+    """
+    Reduction and quantile used to take statistic from the sorted values.
+
+    Returns (reduction, q) where reduction is one of the values of
+    _SORTED_STATS or 'nanquantile' with q the quantile between 0 and 1,
+    q is None for the other reductions. Returns None if the statistic
+    can not be taken from the sorted values, including a q out of range
+    so that numpy raises its usual error when it is applied to each bin.
+    """
+    if (
+        isinstance(statistic, partial)
+        and statistic.func in _SORTED_QUANTILES
+        and not statistic.args
+        and list(statistic.keywords) == ["q"]
+        and np.ndim(statistic.keywords["q"]) == 0
+    ):
+        q = statistic.keywords["q"] / _SORTED_QUANTILES[statistic.func]
+        return ("nanquantile", q) if 0 <= q <= 1 else None
+
+    try:
+        return _SORTED_STATS[statistic], None
+    except (KeyError, TypeError):
+        return None
+
+
+def _sorted_stat(reduction, q, count, offsets, sorted_vals, nan_count):
+    """Calculate a reduction from _sorted_reduction on the _bin_sorted output."""
+    stat = np.full(nan_count.shape, np.nan)
+    for i, (v, n) in enumerate(zip(sorted_vals, nan_count)):
+        # quantiles of the non NaN values at the start of each bin
+        # with the same linear interpolation between the values
+        # either side of the quantile as np.nanquantile( )
+        if reduction == "nanquantile":
+            has = n > 0
+            h = (n[has] - 1) * q
+            lo = np.floor(h).astype(np.intp)
+            g = h - lo
+            a = v[offsets[has] + lo].astype(np.float64)
+            b = v[offsets[has] + np.minimum(lo + 1, n[has] - 1)]
+            d = b - a
+            stat[i, has] = np.where(g >= 0.5, b - d * (1 - g), a + d * g)
+            continue
+
+        # as in scipy the min ignores NaN values and
+        # the max is NaN if any of the values are
+        has = count > 0
+        if reduction == "min":
+            stat[i, has] = v[offsets[has]]
+            continue
+        if reduction == "max":
+            stat[i, has] = v[offsets[has] + count[has] - 1]
+            continue
+
+        # a plain median counts the NaN values at the end of
+        # each bin as scipy.stats.binned_statistic( ) does
+        if reduction == "median":
+            n = count
+
+        # mean of the two middle values of each bin
+        has = n > 0
+        lo = offsets[has] + (n[has] - 1) // 2
+        hi = offsets[has] + n[has] // 2
+        stat[i, has] = (v[lo].astype(np.float64) + v[hi]) / 2
+
+    return stat
+
+
+def _bin_apply(statistic, bin_idx, values, nbins):
+    """
+    Apply a callable statistic to the values of each bin.
+
+    Parameters
+    ----------
+    statistic : callable
+        Function taking the values in a bin and returning a scalar.
+    bin_idx : np.ndarray
+        Flattened bin number of each sample, -1 if it is not binned.
+    values : np.ndarray
+        Data with shape (number of columns, number of samples).
+    nbins : int
+        Total number of bins.
+
+    Returns
+    -------
+    stat : np.ndarray
+        Statistic for each bin and column, shape (values.shape[0], nbins).
+        Empty bins are set to statistic([]), or NaN if that fails.
+
+    """
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        try:
+            null = statistic([])
+        except Exception:
+            null = np.nan
+    stat = np.full((values.shape[0], nbins), null, dtype=np.float64)
+
+    # group the samples by bin keeping their order within each bin
+    binned = bin_idx >= 0
+    bin_idx = bin_idx[binned]
+    order = np.argsort(bin_idx, kind="stable")
+    values = values[:, binned][:, order]
+    count = np.bincount(bin_idx, minlength=nbins)
+    ends = np.cumsum(count)
+
+    for b in np.flatnonzero(count):
+        for i, v in enumerate(values):
+            stat[i, b] = statistic(v[ends[b] - count[b] : ends[b]])
+
+    return stat
+
+
+def _analysis_dtype(values, dtype):
+    """
+    Type a column is analysed in, dtype unless that would round its values.
+
+    Floating point and boolean columns are analysed in dtype, as are
+    integer columns if all of their values are exactly representable in
+    it. Any other column is analysed in float64.
+    """
+    kind = values.dtype.kind
+    if kind in "fb":
+        return np.dtype(dtype)
+    if kind in "iu":
+        exact = 2 ** (np.finfo(dtype).nmant + 1)
+        if len(values) == 0 or -exact <= values.min() and values.max() <= exact:
+            return np.dtype(dtype)
+    return np.dtype(np.float64)
+
+
+def _as_i8(times, tz=None):
+    """
+    Datetimes as int64 nanoseconds, timezone aware times are in UTC.
+
+    As for a label based slice of the data, times must be timezone aware
+    if and only if the data index is, tz is the timezone of that index.
+    """
+    try:
+        times = pd.DatetimeIndex(times)
+    except ValueError:
+        # pandas can not put times from several timezones in one
+        # index so they are converted to the index timezone first
+        if tz is None:
+            raise
+        times = pd.DatetimeIndex([pd.Timestamp(t).tz_convert(tz) for t in times])
+    if (times.tz is None) != (tz is None):
+        raise TypeError(
+            "Cannot compare tz-naive and tz-aware datetime-like objects, the "
+            "event times and the data index must both be tz-naive or tz-aware"
+        )
+    return np.asarray(times.values, dtype="datetime64[ns]").view("i8")
+
+
+def _phase_rows(idx_i8, lo, hi):
+    """
+    Gather the rows and normalized time for one phase of each event.
+
+    Parameters
+    ----------
+    idx_i8 : np.ndarray
+        Time index of the data as int64 nanoseconds.
+    lo, hi : np.ndarray
+        Row positions bounding the phase of each event, the
+        phase of event i covers idx_i8[lo[i]:hi[i]].
+
+    Returns
+    -------
+    rows : np.ndarray
+        Row positions of every sample in the phase for all events.
+    t_norm : np.ndarray
+        Time of each sample normalized from 0-1 across its phase.
+
+    """
+    counts = hi - lo
+
+    # row positions for all events built from a running
+    # count offset by the start of each event
+    offsets = np.cumsum(counts) - counts
+    rows = np.arange(counts.sum()) + np.repeat(lo - offsets, counts)
+
+    # normalize the time of each phase between 0 and 1 straight
+    # from the int64 nanoseconds, the unit cancels in the ratio
+    # a phase with a single sample has no duration so its time
+    # is left as NaN (0/0) and the sample is not binned
+    t_norm = (idx_i8[rows] - np.repeat(idx_i8[lo], counts)).astype(np.float64)
+    with np.errstate(invalid="ignore"):
+        t_norm /= np.repeat(idx_i8[hi - 1] - idx_i8[lo], counts)
+
+    return rows, t_norm
+
+
+def _gather_phase(idx_i8, col_mat, lo, hi):
+    """
+    Gather the rows, normalized time and data for one phase of each event.
+
+    Parameters
+    ----------
+    idx_i8 : np.ndarray
+        Time index of the data as int64 nanoseconds.
+    col_mat : np.ndarray
+        Data for every row with shape (number of columns, number of rows).
+    lo, hi : np.ndarray
+        Row positions bounding the phase of each event.
+
+    Returns
+    -------
+    rows, t_norm : np.ndarray
+        See _phase_rows.
+    vals : np.ndarray
+        Data for the phase with shape (number of columns, len(rows)).
+
+    """
+    rows, t_norm = _phase_rows(idx_i8, lo, hi)
+
+    # the data is written straight into a preallocated array,
+    # avoiding per column temporaries, vals is row-major so each
+    # column is contiguous for the per column binning that follows
+    vals = np.empty((col_mat.shape[0], len(rows)), dtype=col_mat.dtype)
+    np.take(col_mat, rows, axis=1, out=vals)
+
+    return rows, t_norm, vals
 
 
 def sean(
@@ -46,6 +591,7 @@ def sean(
     y_col=False,
     y_dimensions=False,
     return_data=False,
+    dtype=np.float32,
 ):
     """
 
@@ -53,12 +599,16 @@ def sean(
     ----------
     data : Pandas DataFrame
         Contains the data with which to perform the normalized SEA on.
-        Must have datatime like index.
+        Must have datatime like index sorted in increasing time.
     events : list
         List of three arrays/lists [t0, t1, t2] containing the start (t0),
         epoch (t1) and end times (t2) of each event.
         Phase 1 is defined to be between t0 and t1
         Phase 2 is defined to be between t1 and t2
+        Times are exact instants and both ends of each phase are inclusive,
+        a date string such as '2020-01-04' is midnight at the start of that
+        day rather than the whole day as in a DataFrame.loc slice. Times
+        must be timezone aware if and only if the index of data is.
     x_dimensions : list
         list [x1, x2] containing two elements specifying the desired number of
         normalised time bins in [phase 1, phase 2].
@@ -69,10 +619,11 @@ def sean(
         The default is False.
     seastats : dict, optional
         Dictionary defining the statistics to be used for the superposed epoch
-        analysis via the scipy.binned_statistic function.
+        analysis on the binned data.
              - format is {'stat_name':stat_function}
              - stat_function can be a string, e.g. as defined in
-             scipy.stats.binned_statistic( ), a callable, e.g., np.nanmean,
+             scipy.stats.binned_statistic( ) ('mean', 'median', 'count',
+             'sum', 'std', 'min' or 'max'), a callable, e.g., np.nanmean,
              or a lambda defined callable e.g., the 90th percental
              p90 = lambda stat: np.nanpercentile(stat, 90)
 
@@ -84,6 +635,17 @@ def sean(
          Recommended to use numpy functions as they can handle NaN better then
          the builtin scipy.stats.binned_statistic( ) statistics.
 
+         'count', 'sum', 'mean', np.sum, np.nansum, np.mean and np.nanmean
+         are calculated directly from the per bin sums and counts, and
+         'median', 'min', 'max' and their numpy equivalents from the sorted
+         values of each bin, as are percentiles given as
+         functools.partial(np.nanpercentile, q=90) (or np.nanquantile).
+         These are much faster than other statistics. If numba is
+         installed and only the sum and count statistics are requested they
+         are accumulated in parallel straight from the events, using all of
+         numba's threads (see numba.set_num_threads( ) or the
+         NUMBA_NUM_THREADS environment variable).
+
          The default is False, which will return the default statistics:
              are mean, median, upper and lower quartile
     y_col : list, optional
@@ -100,6 +662,16 @@ def sean(
     Both y_col and y_dimension must be set to perform a 2D normalized
     superposed epoch anlysis, e.g., in time and space (L-shell or MLT).
 
+    dtype : numpy dtype, optional
+        Floating point type the columns in cols are analysed in. float32
+        halves the memory moved when binning the data, sums are still
+        accumulated in float64. Use np.float64 for full precision.
+        Integer columns are only analysed in dtype if all of their values
+        are exactly representable in it (up to 2**24 for float32), all of
+        the columns are analysed in float64 if any column is not. The data
+        returned with return_data keeps the types of the columns of data.
+        The default is np.float32.
+
     Returns
     -------
     SEAdat : Pandas DataFrame
@@ -124,7 +696,7 @@ def sean(
             min - min value of second dimension defined in y_dimensions
             max - max value of second dimension defined in y_dimensions
             bin - bin value of second dimension defined in y_dimensions
-            edges - edges of bins used in scipy.stats.binned_statistic2d( )
+            edges - edges of the bins used for the second dimension
 
             y_rtn = {'min':ymin, 'max':ymax, 'bin':y_spacing, 'edges':y_edges}
             meta = {'sea_cols':cols, 'stats':stat_vals, 'y_meta':y_rtn}
@@ -134,18 +706,10 @@ def sean(
     # get the required epochs from the event list
     starts, epochs, ends = events
 
-    # determine the spacing in normalized time for both phases
-    # each phase is normalized to 1 and then binned based on the
-    # spacing and bin sizes defined by x_dimensions
-    x1_spacing, x2_spacing = 1 / x_dimensions[0], 1 / x_dimensions[1]
-
-    x1_bin = np.int64(x_dimensions[0])
-    x2_bin = np.int64(x_dimensions[1])
-
     # if a series is passed convert it to a data frame for simplicity
     if isinstance(data, pd.Series):
         se_data = data.to_frame("data")
-        cols = "data"
+        cols = ["data"]
     elif cols:
         # determine what columns we're keeping for analysis
         # if y_col is defined then append the y data for
@@ -158,14 +722,14 @@ def sean(
         # passed DataFrame
         # convert to DataFrame if
         # on column is passed
-        se_data = data[col_dat].copy()
+        se_data = data[col_dat]
         if isinstance(se_data, pd.Series):
             se_data = se_data.to_frame(col_dat)
 
     # if cols is False keep them all
     # no need to account for 2D data here
     else:
-        se_data = data.copy()
+        se_data = data
         cols = se_data.columns.values.tolist()
         y_col = False
 
@@ -176,8 +740,8 @@ def sean(
     if seastats and isinstance(seastats, dict):
         stat_vals = seastats
     else:
-        lq_nan = lambda stat: np.nanpercentile(stat, 25)
-        uq_nan = lambda stat: np.nanpercentile(stat, 75)
+        lq_nan = partial(np.nanpercentile, q=25)
+        uq_nan = partial(np.nanpercentile, q=75)
 
         stat_vals = {
             "mean": np.nanmean,
@@ -187,68 +751,83 @@ def sean(
             "cnt": "count",
         }
 
-    # number of events for reference later on
-    gc.collect()
-
-    # Initialize lists to store dataframes for concatenation later
-    phase1_dfs = []
-    phase2_dfs = []
-
-    # loop through events normalize time and collect data
-    for event in tqdm(range(len(starts))):
-        # get the epochs for the event
-        start = starts[event]
-        epoch = epochs[event]
-        end = ends[event]
-
-        # Flag to indicate if the event should be skipped
-        skip_event = False
-
-        # get phase 1 and phase 2 data (slice without copying)
-        phase1 = se_data.loc[start:epoch]
-        phase2 = se_data.loc[epoch:end]
-
-        for phase in [phase1, phase2]:
-            if phase.empty:
-                print(f"There is no data for event {event}")
-                skip_event = True
-                break
-
-        # Skip the rest of the current iteration of the outer loop if flagged
-        if skip_event:
-            continue
-
-        # If execution reaches here, both phases have data and can be processed
-        for phase, storage in [(phase1, phase1_dfs), (phase2, phase2_dfs)]:
-            # Normalize the time without copying dataframes
-            t_norm = phase.index - phase.index[0]
-            t_norm = t_norm.total_seconds()
-            p_min, p_max = t_norm[0], t_norm[-1]
-            t_norm = (t_norm - p_min) / (p_max - p_min)
-
-            # Use assign to avoid changing original 'se_data'
-            normalized_phase = phase.assign(t_norm=t_norm)
-            storage.append(normalized_phase)
-
-    # Concatenate all dataframes outside the loop
-    p1data = pd.concat(phase1_dfs)
-    p2data = pd.concat(phase2_dfs)
+    # pull the analysis columns out of the DataFrame once as
+    # contiguous arrays so slicing and binning work on raw
+    # numpy memory, the DataFrame is not needed after this
+    col_arrays = {
+        c: np.ascontiguousarray(se_data[c].to_numpy()) for c in se_data.columns
+    }
+    se_index = se_data.index
+    del se_data
+
+    # the phase boundaries are found with a binary search
+    # of the time index which only works if it is sorted
+    if not se_index.is_monotonic_increasing:
+        raise ValueError("data must have a time index sorted in increasing order")
+
+    # analyse the columns in the requested floating point type
+    # unless a column, such as one of large integers, would be
+    # rounded by it, col_arrays keeps the data as it was passed
+    # for y_col, so samples on a y edge bin exactly, and for
+    # return_data
+    mat_dtype = np.result_type(*[_analysis_dtype(col_arrays[c], dtype) for c in cols])
+
+    # put the analysis columns in one (columns, rows) matrix
+    # stored column-major, the values of all of the columns
+    # for a row are then adjacent so gathering the rows of a
+    # phase and the kernel's loop over columns read memory
+    # sequentially
+    col_mat = np.empty((len(cols), len(se_index)), dtype=mat_dtype, order="F")
+    for i, c in enumerate(cols):
+        col_mat[i] = col_arrays[c]
+
+    # convert the time index and the event times to int64
+    # nanoseconds once so the phase boundaries of every event
+    # can be found with a vectorized binary search rather
+    # than a label based slice of the DataFrame per event,
+    # as for a slice the event times must be timezone aware
+    # if and only if the index is
+    tz = pd.DatetimeIndex(se_index).tz
+    idx_i8 = _as_i8(se_index, tz)
+    starts_i8, epochs_i8, ends_i8 = (_as_i8(t, tz) for t in (starts, epochs, ends))
+
+    # sort the events by start time so the phase boundaries
+    # increase monotonically and the data of consecutive
+    # events is read from neighbouring memory, the statistics
+    # are aggregated so do not depend on the event order
+    order = np.argsort(starts_i8, kind="stable")
+    starts_i8, epochs_i8, ends_i8 = starts_i8[order], epochs_i8[order], ends_i8[order]
+
+    # phase boundaries as row positions for both phases of
+    # every event from a single binary search on each side,
+    # both ends are inclusive to match data.loc[start:epoch]
+    p1_lo, p2_lo = np.split(
+        np.searchsorted(idx_i8, np.concatenate([starts_i8, epochs_i8]), "left"), 2
+    )
+    p1_hi, p2_hi = np.split(
+        np.searchsorted(idx_i8, np.concatenate([epochs_i8, ends_i8]), "right"), 2
+    )
+
+    # skip any event where either phase has no data, the
+    # skipped events are reported together in one warning
+    # showing the first few of them
+    valid = (p1_hi > p1_lo) & (p2_hi > p2_lo)
+    if not valid.all():
+        skipped = np.sort(order[~valid]).tolist()
+        more = "..." if len(skipped) > 10 else ""
+        warnings.warn(
+            f"No data for {len(skipped)} events: {skipped[:10]}{more}", stacklevel=2
+        )
+
+    p1_lo, p1_hi = p1_lo[valid], p1_hi[valid]
+    p2_lo, p2_hi = p2_lo[valid], p2_hi[valid]
 
     # calculate the normalized SEA
     # statistics
 
-    # create bins and edges in normalized
-    # time for binning the data in both phases
-    x1_edges = np.linspace(0, 1, x1_bin)
-    x2_edges = np.linspace(0, 1, x2_bin)
-
-    x1bins = x1_edges[0:-1]
-    x2bins = x2_edges[0:-1]
-
-    # x1bins = np.arange(0, 1., x1_spacing)
-    # x1_edges = np.arange(0, 1. + x1_spacing, x1_spacing)
-    # x2bins = np.arange(0, 1., x2_spacing)
-    # x2_edges = np.arange(0, 1. + x2_spacing, x2_spacing)
+    # get the bin edges in normalized time for
+    # both phases and the normalized time axis
+    x1_edges, x2_edges, t_norm = _time_axis(*x_dimensions)
 
     # if calculating 2D SEA then calculate the y bins
     if y_col and y_dimensions:
@@ -258,71 +837,137 @@ def sean(
     else:
         sea2d = False
 
-    # create normalized time axis
-    t_norm = (x1bins - x1bins.max() - x1_spacing) / x1_spacing
-    t_norm = np.concatenate([t_norm, x2bins / x2_spacing])
+    # statistics for both phases and their
+    # column names, these are put into the
+    # returned DataFrame in one go at the end
+    sea_stats = []
+    sea_names = []
 
-    # create return DataFrame
-    SEAdat = pd.DataFrame()
-    SEAdat["t_norm"] = t_norm
+    # shape of the statistics calculated for each phase
+    if sea2d:
+        p1_shape = (len(cols), len(x1_edges) - 1, len(y_edges) - 1)
+        p2_shape = (len(cols), len(x2_edges) - 1, len(y_edges) - 1)
+    else:
+        p1_shape = (len(cols), len(x1_edges) - 1)
+        p2_shape = (len(cols), len(x2_edges) - 1)
+
+    # with numba installed and only sum and count statistics to
+    # calculate they are accumulated straight from the events by
+    # a compiled kernel without gathering the phase data, if the
+    # data is gathered anyway the sums are taken from it instead
+    use_kernel = (
+        numba is not None
+        and not return_data
+        and all(s_fun in _BINCOUNT_STATS for s_fun in stat_vals.values())
+    )
+
+    if not use_kernel:
+        # gather the rows, normalized time and data of
+        # each phase for all of the events at once, the
+        # data for all of the columns is put in a single
+        # contiguous (columns, samples) array so the
+        # bins are only found once per statistic
+        p1_rows, p1_tnorm, p1_vals = _gather_phase(idx_i8, col_mat, p1_lo, p1_hi)
+        p2_rows, p2_tnorm, p2_vals = _gather_phase(idx_i8, col_mat, p2_lo, p2_hi)
+
+        # the phase data is only put in a DataFrame if it is
+        # returned, with t_norm passed to the constructor
+        # rather than assigned to a copy of the DataFrame
+        if return_data:
+            p1data = {c: v[p1_rows] for c, v in col_arrays.items()}
+            p1data["t_norm"] = p1_tnorm
+            p1data = pd.DataFrame(p1data, index=se_index[p1_rows])
+            p2data = {c: v[p2_rows] for c, v in col_arrays.items()}
+            p2data["t_norm"] = p2_tnorm
+            p2data = pd.DataFrame(p2data, index=se_index[p2_rows])
+
+        # find the bin of each sample once so
+        # it can be reused for every statistic
+        if sea2d:
+            p1_y = col_arrays[y_col][p1_rows]
+            p2_y = col_arrays[y_col][p2_rows]
+            p1_bins = _bin_numbers(p1_tnorm, x1_edges, p1_y, y_edges)
+            p2_bins = _bin_numbers(p2_tnorm, x2_edges, p2_y, y_edges)
+        else:
+            p1_bins = _bin_numbers(p1_tnorm, x1_edges)
+            p2_bins = _bin_numbers(p2_tnorm, x2_edges)
 
-    # convert phase normalized data into
-    # a list of lists that can be passed
-    # as a single function call to
-    # stat_binned_statistic
-    ph1list = [p1data[x] for x in cols]
-    ph2list = [p2data[x] for x in cols]
+    # per bin sums and counts and the sorted
+    # values of each bin are only calculated
+    # if a statistic needs them
+    p1_sums = p2_sums = None
+    p1_sorted = p2_sorted = None
 
     # loop over the stat values that
     # need to be calculated and calculate
-    # them for each column from ph1/ph2list
+    # them for each column from p1/p2_vals
     for s_name, s_fun in stat_vals.items():
-        # 2D superposed epoch analysis
+        sorted_reduction = _sorted_reduction(s_fun)
+
+        # statistics built from the per bin sums and counts
+        if s_fun in _BINCOUNT_STATS:
+            if p1_sums is None and use_kernel:
+                if sea2d:
+                    ny = len(y_edges) - 1
+                    y_idx = _uniform_bin(col_arrays[y_col], y_edges)
+                else:
+                    ny = 1
+                    y_idx = np.zeros(len(idx_i8), dtype=np.intp)
+                p1_sums = _event_sums(
+                    idx_i8, col_mat, p1_lo, p1_hi, x1_edges, y_idx, ny
+                )
+                p2_sums = _event_sums(
+                    idx_i8, col_mat, p2_lo, p2_hi, x2_edges, y_idx, ny
+                )
+            elif p1_sums is None:
+                p1_sums = _bin_sums(p1_bins, p1_vals, np.prod(p1_shape[1:]))
+                p2_sums = _bin_sums(p2_bins, p2_vals, np.prod(p2_shape[1:]))
+            reduction = _BINCOUNT_STATS[s_fun]
+            p1stat = _sum_stat(reduction, *p1_sums).reshape(p1_shape)
+            p2stat = _sum_stat(reduction, *p2_sums).reshape(p2_shape)
+
+        # medians, quantiles, minima and maxima are taken from
+        # the values of each bin sorted once for all statistics
+        elif sorted_reduction is not None:
+            if p1_sorted is None:
+                p1_sorted = _bin_sorted(p1_bins, p1_vals, np.prod(p1_shape[1:]))
+                p2_sorted = _bin_sorted(p2_bins, p2_vals, np.prod(p2_shape[1:]))
+            p1stat = _sorted_stat(*sorted_reduction, *p1_sorted).reshape(p1_shape)
+            p2stat = _sorted_stat(*sorted_reduction, *p2_sorted).reshape(p2_shape)
+
+        # any other statistic is called on the
+        # values of each bin in turn
+        else:
+            if isinstance(s_fun, str):
+                if s_fun not in _NAMED_STATS:
+                    raise ValueError(f"invalid statistic {s_fun!r}")
+                s_fun = _NAMED_STATS[s_fun]
+            p1stat = _bin_apply(s_fun, p1_bins, p1_vals, np.prod(p1_shape[1:]))
+            p2stat = _bin_apply(s_fun, p2_bins, p2_vals, np.prod(p2_shape[1:]))
+            p1stat = p1stat.reshape(p1_shape)
+            p2stat = p2stat.reshape(p2_shape)
+
+        # join the phases along normalized time
+        sea_stats.append(np.concatenate([p1stat, p2stat], axis=1))
         if sea2d:
-            p1stat, _, y1_v, _ = stats.binned_statistic_2d(
-                p1data["t_norm"],
-                p1data[y_col],
-                values=ph1list,
-                bins=[x1_edges, y_edges],
-                statistic=s_fun,
-            )
-            p2stat, _, y2_v, _ = stats.binned_statistic_2d(
-                p2data["t_norm"],
-                p2data[y_col],
-                values=ph2list,
-                bins=[x2_edges, y_edges],
-                statistic=s_fun,
-            )
-            # loop over the columns and ybins
-            # to fill DataFrame
-            for i in np.arange(p1stat.shape[0]):
-                for j in np.arange(p1stat.shape[2]):
-
-                    SEAdat[cols[i] + "_" + s_name + f"_{j:03d}"] = np.concatenate(
-                        [p1stat[i, :, j], p2stat[i, :, j]], axis=0
-                    )
-
-        # 1D superposed epoch analysis
+            sea_names += [
+                f"{c}_{s_name}_{j:03d}" for c in cols for j in range(p1stat.shape[2])
+            ]
         else:
-            p1stat, _, _ = stats.binned_statistic(
-                p1data["t_norm"], values=ph1list, bins=x1_edges, statistic=s_fun
-            )
-            p2stat, _, _ = stats.binned_statistic(
-                p2data["t_norm"], values=ph2list, bins=x2_edges, statistic=s_fun
-            )
-
-            # loop over the columns and add the superposed
-            # data to the returned DataFrame
-            for (
-                p1_col,
-                p2_col,
-                c,
-            ) in zip(p1stat, p2stat, cols):
-
-                SEAdat[c + "_" + s_name] = np.concatenate([p1_col, p2_col], axis=0)
-
-    # set t_norm as the index
-    SEAdat = SEAdat.set_index("t_norm")
+            sea_names += [f"{c}_{s_name}" for c in cols]
+
+    # build the returned DataFrame with t_norm as the index, the
+    # statistics are (stat, column, t_norm[, y]) so normalized
+    # time is moved to the front and the rest flattened into
+    # columns ordered by stat, column and then y bin
+    sea_stats = np.moveaxis(np.array(sea_stats), 2, 0).reshape(len(t_norm), -1)
+    SEAdat = pd.DataFrame(
+        sea_stats, columns=sea_names, index=pd.Index(t_norm, name="t_norm")
+    )
+
+    # the events are processed all at once rather than in
+    # a loop so progress is logged once when they are done
+    logger.info("done %d events", np.count_nonzero(valid))
 
     if isinstance(cols, str):
         cols = [cols]
@@ -13,7 +13,8 @@ setup(name='sea_norm',
       license='MIT License',
       license_file = 'LICENSE.md',
       url='https://github.com/samwalton7645/SEA_Code',
-      install_requires=['pandas>=1.1.5','numpy>=1.21.6','scipy>=1.2.1','tqdm>=4.36.1'],
+      install_requires=['pandas>=1.1.5','numpy>=1.21.6'],
+      extras_require={'numba':['numba>=0.55'],'test':['pytest','scipy']},
       long_description=long_description,
       long_description_content_type="text/markdown",
       packages=find_packages(),
@@ -0,0 +1,281 @@
+"""
+Compare sean( ) against scipy.stats.binned_statistic( ) and
+binned_statistic_2d( ) applied to the per event .loc slices of the
+data, which is how sean( ) originally binned the data.
+
+scipy is only needed to run the tests.
+"""
+
+import warnings
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pytest
+
+stats = pytest.importorskip("scipy.stats")
+
+import sea_norm.sea_norm as sea_module
+from sea_norm import sean
+
+STATISTICS = {
+    "mean": "mean",
+    "median": "median",
+    "count": "count",
+    "sum": "sum",
+    "std": "std",
+    "min": "min",
+    "max": "max",
+    "np_mean": np.mean,
+    "nanmean": np.nanmean,
+    "np_median": np.median,
+    "nanmedian": np.nanmedian,
+    "nansum": np.nansum,
+    "p10": partial(np.nanpercentile, q=10),
+    "q90": partial(np.nanquantile, q=0.9),
+    "p90": lambda x: np.nanpercentile(x, 90),
+    # empty bins are set to statistic([]), here 0
+    "len": len,
+}
+
+SUM_STATISTICS = {
+    "mean": "mean",
+    "count": "count",
+    "sum": "sum",
+    "nanmean": np.nanmean,
+    "nansum": np.nansum,
+}
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    n = 5000
+    index = pd.date_range("2000-01-01", periods=n, freq="1min")
+    df = pd.DataFrame(
+        {
+            "V": rng.normal(400, 50, n).round(1),
+            "P": rng.gamma(2, 2, n),
+            "SymH": rng.integers(-200, 20, n),
+            # y values rounded onto the y bin edges, including the
+            # last edge, to check samples on an edge are binned
+            "L": rng.uniform(2.0, 5.5, n).round(1),
+        },
+        index=index,
+    )
+    df.loc[df.sample(frac=0.05, random_state=1).index, "V"] = np.nan
+    df.loc[df.sample(frac=0.05, random_state=2).index, "L"] = np.nan
+    return df
+
+
+@pytest.fixture(scope="module")
+def events(data):
+    rng = np.random.default_rng(1)
+    n = 20
+    start = np.sort(rng.integers(0, len(data) - 400, n))
+    epoch = start + rng.integers(1, 150, n)
+    end = epoch + rng.integers(1, 250, n)
+
+    # an event with a single sample in phase 1, which is not binned
+    start[0] = epoch[0]
+
+    index = data.index
+    return [index[start], index[epoch], index[end]]
+
+
+def _reference(data, events, x_dimensions, cols, seastats, y_col, y_dimensions):
+    """The normalized SEA calculated with scipy from per event slices."""
+    phases = ([], [])
+    for start, epoch, end in zip(*events):
+        for phase, store in zip((data.loc[start:epoch], data.loc[epoch:end]), phases):
+            t_norm = (phase.index - phase.index[0]).total_seconds()
+            with np.errstate(invalid="ignore"):
+                store.append(phase.assign(t_norm=t_norm / t_norm[-1]))
+    p1data, p2data = pd.concat(phases[0]), pd.concat(phases[1])
+
+    x1_edges = np.linspace(0, 1, x_dimensions[0])
+    x2_edges = np.linspace(0, 1, x_dimensions[1])
+    if y_col:
+        ymin, ymax, y_spacing = y_dimensions
+        y_edges = np.arange(ymin, ymax + y_spacing, y_spacing)
+
+    ref = {}
+    for s_name, s_fun in seastats.items():
+        p_stats = []
+        for phase, x_edges in ((p1data, x1_edges), (p2data, x2_edges)):
+            values = [phase[c].to_numpy(dtype=np.float64) for c in cols]
+            if y_col:
+                p_stat = stats.binned_statistic_2d(
+                    phase["t_norm"],
+                    phase[y_col],
+                    values,
+                    bins=[x_edges, y_edges],
+                    statistic=s_fun,
+                )[0]
+            else:
+                p_stat = stats.binned_statistic(
+                    phase["t_norm"], values, bins=x_edges, statistic=s_fun
+                )[0]
+            p_stats.append(p_stat)
+        p_stat = np.concatenate(p_stats, axis=1)
+
+        for i, c in enumerate(cols):
+            if y_col:
+                for j in range(p_stat.shape[2]):
+                    ref[f"{c}_{s_name}_{j:03d}"] = p_stat[i, :, j]
+            else:
+                ref[f"{c}_{s_name}"] = p_stat[i]
+
+    return ref
+
+
+def _check(
+    data,
+    events,
+    x_dimensions,
+    cols,
+    seastats,
+    y_col=False,
+    y_dimensions=False,
+    rtol=1e-12,
+    atol=1e-9,
+    **kwargs,
+):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        sea, _ = sean(
+            data,
+            events,
+            x_dimensions,
+            cols=cols,
+            seastats=seastats,
+            y_col=y_col,
+            y_dimensions=y_dimensions,
+            **kwargs,
+        )
+        ref = _reference(
+            data, events, x_dimensions, cols, seastats, y_col, y_dimensions
+        )
+
+    assert list(sea.columns) == list(ref)
+    for name, expected in ref.items():
+        np.testing.assert_allclose(
+            sea[name].to_numpy(), expected, rtol=rtol, atol=atol, err_msg=name
+        )
+
+
+@pytest.mark.parametrize("x_dimensions", [[20, 60], [7, 130]])
+def test_1d(data, events, x_dimensions):
+    _check(data, events, x_dimensions, ["V", "P", "SymH"], STATISTICS, dtype=np.float64)
+
+
+# the last y edge is just below 5.5 for a spacing of 0.3, so y
+# values of 5.5 are only binned with scipy's rounding tolerance
+@pytest.mark.parametrize(
+    "y_dimensions", [[2.5, 5.5, 0.1], [2.0, 5.5, 0.25], [2.5, 5.5, 0.3]]
+)
+def test_2d(data, events, y_dimensions):
+    _check(
+        data,
+        events,
+        [9, 31],
+        ["V", "P"],
+        STATISTICS,
+        "L",
+        y_dimensions,
+        dtype=np.float64,
+    )
+
+
+@pytest.mark.parametrize("use_numba", [True, False])
+@pytest.mark.parametrize("y_col", [False, "L"])
+def test_sum_statistics(data, events, monkeypatch, use_numba, y_col):
+    # with only sum and count statistics they are accumulated by
+    # the numba kernel if numba is installed, or by np.bincount
+    if use_numba and sea_module.numba is None:
+        pytest.skip("numba is not installed")
+    if not use_numba:
+        monkeypatch.setattr(sea_module, "numba", None)
+    y_dimensions = [2.5, 5.5, 0.1] if y_col else False
+    _check(
+        data,
+        events,
+        [20, 60],
+        ["V", "P"],
+        SUM_STATISTICS,
+        y_col,
+        y_dimensions,
+        dtype=np.float64,
+    )
+
+
+@pytest.mark.parametrize("y_col", [False, "L"])
+def test_default_dtype(data, events, y_col):
+    # the data is analysed in float32 by default so the statistics
+    # only agree with scipy to float32 precision, which for the std
+    # of values around 400 is an absolute error of a few 1e-6
+    y_dimensions = [2.5, 5.5, 0.1] if y_col else False
+    _check(
+        data,
+        events,
+        [20, 60],
+        ["V", "P", "SymH"],
+        STATISTICS,
+        y_col,
+        y_dimensions,
+        rtol=1e-5,
+        atol=1e-4,
+    )
+
+
+def test_integer_columns_keep_float32(data, events):
+    # SymH is an integer column exactly representable in
+    # float32 so V is still analysed in float32 with it
+    seastats = {"mean": "mean", "median": "median"}
+    with_int, _ = sean(data, events, [20, 60], cols=["V", "SymH"], seastats=seastats)
+    alone, _ = sean(data, events, [20, 60], cols=["V"], seastats=seastats)
+    pd.testing.assert_frame_equal(with_int[alone.columns], alone, check_exact=True)
+
+
+def test_large_integer_columns(data, events):
+    # integers above 2**24 are rounded by float32 so
+    # a column of them is analysed in float64 instead
+    large = pd.DataFrame({"big": 2**24 + 1 + np.arange(len(data)) % 2}, data.index)
+    seastats = {"mean": "mean", "max": "max"}
+    sea, _ = sean(large, events, [20, 60], seastats=seastats)
+    exact, _ = sean(large, events, [20, 60], seastats=seastats, dtype=np.float64)
+    pd.testing.assert_frame_equal(sea, exact, check_exact=True)
+    assert sea["big_max"].max() == 2**24 + 2
+
+
+@pytest.mark.parametrize(
+    "statistic",
+    [
+        partial(np.nanpercentile, q=-50),
+        partial(np.nanpercentile, q=150),
+        partial(np.nanquantile, q=1.5),
+    ],
+)
+def test_quantile_out_of_range(data, events, statistic):
+    with pytest.raises(ValueError):
+        sean(data, events, [20, 60], cols=["V"], seastats={"q": statistic})
+
+
+def test_timezone_aware_events(data, events):
+    # lists of tz-aware timestamps are compared with a tz-aware
+    # index in UTC, whatever timezone either of them is in
+    aware = data.tz_localize("UTC").tz_convert("US/Eastern")
+    aware_events = [[t.tz_localize("UTC") for t in times] for times in events]
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", UserWarning)
+        sea, _ = sean(aware, aware_events, [20, 60], cols=["V"])
+    naive, _ = sean(data, events, [20, 60], cols=["V"])
+    pd.testing.assert_frame_equal(sea, naive, check_exact=True)
+
+
+def test_timezone_mismatch(data, events):
+    aware_events = [[t.tz_localize("UTC") for t in times] for times in events]
+    with pytest.raises(TypeError):
+        sean(data, aware_events, [20, 60], cols=["V"])
+    with pytest.raises(TypeError):
+        sean(data.tz_localize("UTC"), events, [20, 60], cols=["V"])